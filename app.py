@@ -1,12 +1,16 @@
 import streamlit as st
 import yfinance as yf
 import pandas as pd
+import numpy as np
+import hashlib
+import time
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from prophet import Prophet
 from datetime import datetime
-import time
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from curl_cffi import requests as requests_cffi # curl_cffiを使用
+from file_cache import FileCache
+from indicators import compute_indicators, trend_season_fit
 
 # --- 1. 銘柄設定 (通信削減のため名前を固定) ---
 TICKERS_CONFIG = {
@@ -29,8 +33,12 @@ PERIOD_OPTIONS = {
     "1週間": {"days": 7, "interval": "30m", "pred_len": 16, "pred_freq": "30min", "label": "数営業日先"},
     "1日": {"days": 1, "interval": "5m", "pred_len": 24, "pred_freq": "5min", "label": "今日の大引け"}
 }
+# 予測は足種ごとに最長の期間で1回だけ行い、各期間では先頭から切り出して使う (6か月→1か月の切替で予測し直さない)
+PRED_LEN_MAX = {o["interval"]: max(p["pred_len"] for p in PERIOD_OPTIONS.values() if p["interval"] == o["interval"]) for o in PERIOD_OPTIONS.values()}
 selected_label = st.sidebar.radio("表示期間", options=list(PERIOD_OPTIONS.keys()), index=2)
 v = PERIOD_OPTIONS[selected_label]
+show_board = st.sidebar.toggle("グラフを1枚にまとめる", value=False)
+accurate_mode = st.sidebar.checkbox("高精度モード (Prophetで予測)", value=False)
 
 st.title("⚖️ 高度分析 & 戦略ボード")
 
@@ -41,112 +49,377 @@ def get_impersonated_session():
     session = requests_cffi.Session(impersonate="chrome")
     return session
 
-@st.cache_data(ttl=900)
+PERIOD_MAP = {"5m": "5d", "30m": "15d", "1d": "2y"}
+# AI予測の学習に使う本数 (日足は約9か月、5分足は4営業日あまり。30分足は取得した15日分すべて)
+FORECAST_HISTORY = {"5m": 288, "30m": 600, "1d": 180}
+
+# 日足のディスクキャッシュ: 15分以内ならそのまま使い、それより古ければ最終日以降だけ取り足す。
+# 最後に全期間を取得してから1日たったら、配当・分割の調整が入っている可能性があるので全期間取り直す
+# 日中足は5分以内のものだけ使う。AI予測(Prophet)は入力データが同じなら1日以内のものを使う
+file_cache = FileCache()
+DAILY_CACHE_FRESH = 900
+DAILY_CACHE_MAX_AGE = 86400
+INTRADAY_CACHE_FRESH = 300
+FORECAST_CACHE_MAX_AGE = 86400
+
+# 複数銘柄を1回の通信で取得し {銘柄: DataFrame} に分ける。取得できなかった銘柄は含まれない
+# 1銘柄だけのときも列が (銘柄, 項目) の2段になるよう multi_level_index を明示する
+def download_frames(tickers, interval, **kwargs):
+    data = yf.download(list(tickers), interval=interval, group_by='ticker', auto_adjust=True, multi_level_index=True,
+                       threads=True, progress=False, session=get_impersonated_session(), **kwargs)
+    frames = {}
+    for ticker in tickers:
+        if ticker not in data.columns.get_level_values(0): continue
+        df = data[ticker].dropna(subset=['Close'])
+        if df.empty: continue
+        # 日足はタイムゾーンなしで返るので、ある場合だけ日本時間に揃える
+        if df.index.tz is not None: df.index = df.index.tz_convert('Asia/Tokyo').tz_localize(None)
+        frames[ticker] = df
+    return frames
+
+# 日足 (ディスクキャッシュ併用で再起動後も取り直さない。当日の足は場中に動くのでメモリ上は15分)
+@st.cache_data(ttl=900, show_spinner=False)
+def get_daily_history(tickers):
+    frames, stale, missing = {}, {}, []
+    for ticker in tickers:
+        cached, age = file_cache.get(f"{ticker}-1d")
+        # 取り足しでもファイルは書き直されるので、全期間取り直しの判定は更新時刻ではなく attrs の取得時刻で行う
+        if cached is None or time.time() - cached.attrs.get('full_fetch', 0) >= DAILY_CACHE_MAX_AGE: missing.append(ticker)
+        elif age < DAILY_CACHE_FRESH: frames[ticker] = cached
+        else: stale[ticker] = cached
+    
+    fetched = download_frames(missing, "1d", period=PERIOD_MAP["1d"]) if missing else {}
+    for df in fetched.values(): df.attrs = {'full_fetch': time.time()}
+    if stale:
+        # キャッシュの最終日以降だけを取得して後ろに足す (当日分は新しい値で上書き)
+        start = min(df.index[-1] for df in stale.values())
+        recent = download_frames(list(stale), "1d", start=start.strftime('%Y-%m-%d'))
+        for ticker, df in stale.items():
+            # 取得できなかった銘柄は書き戻さない (書くと新しいデータ扱いになり、15分間取り直さなくなる)
+            if ticker not in recent:
+                frames[ticker] = df
+                continue
+            full_fetch = df.attrs['full_fetch']
+            df = pd.concat([df, recent[ticker]])
+            df = df[~df.index.duplicated(keep='last')]
+            df = df.loc[df.index[-1] - pd.DateOffset(years=2):]
+            df.attrs = {'full_fetch': full_fetch}
+            fetched[ticker] = df
+    
+    for ticker, df in fetched.items(): file_cache.set(f"{ticker}-1d", df)
+    frames.update(fetched)
+    return frames
+
+# 日中足 (すぐ古くなるので5分で取り直す)
+# ディスクにも置いておき、再起動直後でも5分以内のものはそのまま使う。古ければ全期間を取り直す
+@st.cache_data(ttl=300, show_spinner=False)
+def get_intraday_history(tickers, interval):
+    frames, missing = {}, []
+    for ticker in tickers:
+        cached, age = file_cache.get(f"{ticker}-{interval}")
+        if cached is not None and age < INTRADAY_CACHE_FRESH: frames[ticker] = cached
+        else: missing.append(ticker)
+    
+    if missing:
+        fetched = download_frames(missing, interval, period=PERIOD_MAP[interval])
+        for ticker, df in fetched.items(): file_cache.set(f"{ticker}-{interval}", df)
+        frames.update(fetched)
+    return frames
+
+# 全銘柄の株価をまとめて取得 (銘柄ごとのHTTP往復をなくす)
+def get_all_stock_data(tickers, interval):
+    return get_daily_history(tickers) if interval == "1d" else get_intraday_history(tickers, interval)
+
+# 設定に名前がない銘柄だけ正式名を問い合わせる (.info は1銘柄1リクエストで重いので1日キャッシュ)
+@st.cache_data(ttl=86400, show_spinner=False)
+def get_ticker_name(ticker):
+    return yf.Ticker(ticker, session=get_impersonated_session()).info.get('longName', ticker)
+
+def ticker_name(ticker, info):
+    if info.get('name'): return info['name']
+    # 名前は表示用なので、取れなくても銘柄コードで続ける (例外はキャッシュされず次回取り直す)
+    try: return get_ticker_name(ticker)
+    except Exception: return ticker
+
+# 例外はキャッシュされないので、失敗時は次回の再実行で取り直される
+# 日中足の取得(5分)より長く持つと古い足のまま残るので、TTLはそちらに合わせる
+@st.cache_data(ttl=300, show_spinner=False)
 def get_stock_data(ticker_symbol, interval):
-    session = get_impersonated_session()
-    tk = yf.Ticker(ticker_symbol, session=session)
+    df = get_all_stock_data(tuple(TICKERS_CONFIG), interval).get(ticker_symbol)
+    if df is None: return None, None
     
-    period_map = {"5m": "5d", "30m": "15d", "1d": "2y"}
+    # テクニカル指標はデータと一緒にキャッシュする
+    # カーネルには連続した書き込み可能な1次元配列を渡す。DataFrameの列をそのまま渡すと読み取り専用の
+    # ビューになることがあり、numbaがウォームアップとは別の型として再コンパイルしてしまう
+    close = df['Close'].to_numpy(dtype=np.float64, copy=True)
+    # 前日終値も手元のデータから取る: 最新の足と日付が違う最後の足 (日足なら1本前、日中足なら前日最後の足)
+    day = df.index.to_numpy().astype('datetime64[D]')
+    first_today = day.searchsorted(day[-1])
+    prev_close = close[first_today - 1] if first_today > 0 else close[0]
+    rsi, ma20, std20, upper, lower = compute_indicators(close, 14, 20)
+    # 計算はfloat64で行い、保持・描画用の列はfloat32に落とす (キャッシュとPlotlyのJSONが約半分になる)
+    # 株価は有効数字5桁程度なので四本値もfloat32で足りる。出来高は整数列のときだけint32にする
+    df = df.assign(RSI=rsi, MA20=ma20, STD20=std20, Upper=upper, Lower=lower)
+    df = df.astype({c: 'float32' for c in ('Open', 'High', 'Low', 'Close', 'RSI', 'MA20', 'STD20', 'Upper', 'Lower')})
+    if df['Volume'].dtype.kind == 'i': df['Volume'] = df['Volume'].astype('int32')
     
-    try:
-        # 通信間隔を空ける
-        time.sleep(0.5)
-        df = tk.history(period=period_map[interval], interval=interval)
-        if df.empty: return None, None
-        
-        df.index = df.index.tz_convert('Asia/Tokyo').tz_localize(None)
-        
-        # 前日比用のデータ取得
-        hist_daily = tk.history(period="5d", interval="1d")
-        prev_close = hist_daily['Close'].iloc[-2] if len(hist_daily) > 1 else df['Close'].iloc[0]
-        return df, prev_close
-    except Exception as e:
-        st.error(f"データ取得エラー ({ticker_symbol}): {e}")
-        return None, None
-
-def get_advice(current_price, rsi, upper, lower):
-    if rsi >= 70 or current_price >= upper:
-        return "⚠️ 売り検討", "過熱気味です。利益確定を検討してください。", "error"
-    elif rsi <= 30 or current_price <= lower:
-        return "💎 買い検討", "売られすぎです。リバウンドの好機かもしれません。", "success"
-    return "😐 様子見", "過熱感はなく、安定した推移です。", "info"
+    # 描画で使う最新値はここで Python の float にしておく (描画ループで pandas の添字参照をしない)
+    snap = {'current': float(close[-1]), 'prev': float(prev_close), 'rsi': float(rsi[-1]),
+            'upper': float(upper[-1]), 'lower': float(lower[-1])}
+    return df, snap
+
+# 足種ごとのProphetを作る
+# 短い予測期間には変化点25個(既定)は多すぎるので10個に減らして最適化を軽くする。
+# 表示するのは yhat だけなので、予測区間用のサンプリング(既定1000回)も行わない
+def make_prophet(interval):
+    # prophet の import (cmdstanpy など) は重いので、起動時ではなく最初の学習時に行う。
+    # 最初の呼び出しはワーカースレッドのウォームアップなので、描画を止めずに済む
+    from prophet import Prophet
+    common = dict(n_changepoints=10, changepoint_range=0.9, mcmc_samples=0, uncertainty_samples=0)
+    # 日足には1日1点しかないので日内の季節性は推定できない。週の季節性だけ使う
+    if interval == "1d": return Prophet(daily_seasonality=False, weekly_seasonality=True, **common)
+    # 日中足(5分足5日分・30分足15日分)は土日のデータがなく週の季節性はほぼ推定できないので、
+    # 既定の季節性は切って1日周期の成分だけを少ないフーリエ次数で入れる
+    model = Prophet(daily_seasonality=False, weekly_seasonality=False, yearly_seasonality=False, **common)
+    return model.add_seasonality(name='intraday', period=1, fourier_order=4)
+
+# 学習済みモデルはリソースとして保持 (期間切替で予測長が変わっても再学習しない)
+# _df_p はハッシュ対象外。キーは (銘柄, 足種, 最終時刻, 終値のバイト列)
+@st.cache_resource(ttl=3600, max_entries=32, show_spinner=False)
+def fit_prophet(ticker, interval, last_ts, y_bytes, _df_p):
+    return make_prophet(interval).fit(_df_p)
+
+# Stanモデルの読み込みなど、プロセスで最初の学習にだけかかる準備を小さなデータで一度済ませておく
+# 完全な直線だとL-BFGSが収束せずNewton法に落ちて数秒かかるので、少し揺らした系列を使う
+@st.cache_resource(show_spinner=False)
+def warm_up_prophet():
+    df = pd.DataFrame({'ds': pd.date_range("2024-01-01", periods=30, freq="D"), 'y': np.linspace(1, 2, 30) + 0.1 * np.sin(np.arange(30))})
+    return make_prophet("1d").fit(df).stan_backend
+
+# AI予測 (predictの結果もキャッシュ。同じデータなら再実行時に再計算しない)
+# 使うのは ds と yhat だけ。st.cache_data はヒットのたびに結果を複製するので、残りの成分の列は捨てておく
+# 再起動後も同じデータなら学習し直さないよう、結果はディスクにも置く。
+# ファイルは銘柄・足種ごとに1つで上書きし、どのデータから作った予測かは attrs に入れて照合する
+@st.cache_data(ttl=3600, show_spinner=False)
+def forecast_close(ticker, interval, last_ts, y_bytes, _df_p, pred_len, pred_freq):
+    key, source = f"forecast-{ticker}-{interval}", f"{last_ts}-{pred_len}-{pred_freq}-{hashlib.md5(y_bytes).hexdigest()}"
+    cached, age = file_cache.get(key)
+    if cached is not None and age < FORECAST_CACHE_MAX_AGE and cached.attrs.get('source') == source: return cached
+    
+    model = fit_prophet(ticker, interval, last_ts, y_bytes, _df_p)
+    forecast = model.predict(model.make_future_dataframe(periods=pred_len, freq=pred_freq))[['ds', 'yhat']]
+    forecast.attrs['source'] = source
+    file_cache.set(key, forecast)
+    return forecast
+
+# k 番目の銘柄の軸番号。価格は x{2k+1}/y{2k+1}、RSIは x{2k+2}/y{2k+2} (1番目の軸は番号なし)
+def axis_ids(k):
+    return ('' if k == 0 else str(2 * k + 1)), str(2 * k + 2)
+
+# 1銘柄分のトレースと目標線
+# 各トレースには numpy 配列をそのまま渡す。時刻はミリ秒精度で十分。
+# トレースはWebGL(Scattergl)で描く。SVGより要素数が桁違いに少なく、6銘柄分を開いてもブラウザが重くならない
+def chart_traces(k, x, close, upper, lower, rsi, fore_plot, target_price, target_type, current_price):
+    p, r = axis_ids(k)
+    x = x.astype('datetime64[ms]')
+    traces = [
+        go.Scattergl(x=x, y=upper, name='BB上', line=dict(width=0), showlegend=False, xaxis='x' + p, yaxis='y' + p),
+        go.Scattergl(x=x, y=lower, name='BB下', line=dict(width=0), fill='tonexty', fillcolor='rgba(0,150,255,0.1)', showlegend=False, xaxis='x' + p, yaxis='y' + p),
+        go.Scattergl(x=x, y=close, name='実績', line=dict(color='#0055FF', width=3), xaxis='x' + p, yaxis='y' + p),
+    ]
+    if not fore_plot.empty:
+        pred_c = "#FF0000" if fore_plot['yhat'].iat[-1] >= current_price else "#0000FF"
+        traces.append(go.Scattergl(x=fore_plot['ds'].to_numpy().astype('datetime64[ms]'), y=fore_plot['yhat'].to_numpy(), name='予測', line=dict(color=pred_c, dash='dot', width=3), xaxis='x' + p, yaxis='y' + p))
+    traces.append(go.Scattergl(x=x, y=rsi, name='RSI', line=dict(color='#8A2BE2', width=2), xaxis='x' + r, yaxis='y' + r))
+
+    target_line = dict(type='line', xref=f'x{p} domain', x0=0, x1=1, yref='y' + p, y0=target_price, y1=target_price,
+                       line=dict(dash='dash', color=("#28a745" if target_type == '購入' else "#dc3545")))
+    return traces, target_line
+
+# k 番目の銘柄の軸を縦方向 [lo, hi] の範囲に配置する。上段が価格、下段がRSI
+def chart_axes(k, lo, hi, title=None):
+    p, r = axis_ids(k)
+    h = hi - lo
+    return {f'xaxis{p}': dict(anchor='y' + p, matches='x' + r, showticklabels=False),
+            f'yaxis{p}': dict(anchor='x' + p, domain=[lo + h * 0.37, hi], title=title),
+            f'xaxis{r}': dict(anchor='y' + r), f'yaxis{r}': dict(anchor='x' + r, domain=[lo, lo + h * 0.27])}
+
+# グラフ作成 (表示範囲のデータが同じなら再実行時は作り直さない。キャッシュしやすい dict で返す)
+# トレースとレイアウトを一度に渡して図を組み立てる
+# uirevision が同じ間はデータが更新されてもズームなどの操作状態を保つ (表示期間を変えたときだけ戻す)
+@st.cache_data(ttl=900, show_spinner=False)
+def build_figure(x, close, upper, lower, rsi, fore_plot, target_price, target_type, current_price, uirevision=None):
+    traces, target_line = chart_traces(0, x, close, upper, lower, rsi, fore_plot, target_price, target_type, current_price)
+    fig = go.Figure(data=traces, layout=go.Layout(
+        **chart_axes(0, 0.0, 1.0), shapes=[target_line], height=450, margin=dict(l=0,r=0,b=0,t=10), showlegend=False, hovermode="x unified",
+        uirevision=uirevision))
+    return fig.to_dict()
+
+# 全銘柄を1つの図にまとめる (charts は [(銘柄名, build_figure と同じ引数), ...])
+# 図が1つなのでJSONの送信もPlotly.jsの初期化も1回で済む
+@st.cache_data(ttl=900, show_spinner=False)
+def build_board_figure(charts, uirevision=None):
+    n = len(charts)
+    traces, shapes, axes = [], [], {}
+    for k, (name, args) in enumerate(charts):
+        t, line = chart_traces(k, *args)
+        traces += t
+        shapes.append(line)
+        # 銘柄ごとに高さ 1/n の枠を割り当て、枠の上側を少し空けて隣と詰まらないようにする
+        axes.update(chart_axes(k, 1 - (k + 1) / n, 1 - (k + 0.08) / n, title=name))
+    fig = go.Figure(data=traces, layout=go.Layout(
+        **axes, shapes=shapes, height=450 * n, margin=dict(l=0,r=0,b=0,t=10), showlegend=False, hovermode="x unified",
+        uirevision=uirevision))
+    return fig.to_dict()
+
+# 判定結果 (売り / 買い / 様子見) の表示内容
+ADVICE = (
+    ("⚠️ 売り検討", "過熱気味です。利益確定を検討してください。", "error"),
+    ("💎 買い検討", "売られすぎです。リバウンドの好機かもしれません。", "success"),
+    ("😐 様子見", "過熱感はなく、安定した推移です。", "info"),
+)
+
+# 全銘柄の (現在値, RSI, BB上, BB下) を1つの配列にまとめ、売買判定を一括で行う
+def get_advice(snaps):
+    price, rsi, upper, lower = np.array([[s['current'], s['rsi'], s['upper'], s['lower']] for s in snaps], dtype=np.float64).reshape(-1, 4).T
+    sell = (rsi >= 70) | (price >= upper)
+    buy = (rsi <= 30) | (price <= lower)
+    return [ADVICE[i] for i in np.where(sell, 0, np.where(buy, 1, 2))]
+
+# 前日比・目標比 (差額と%) も全銘柄まとめて計算する。1行が1銘柄の [前日比, 前日比%, 目標比, 目標比%]
+def get_changes(snaps, targets):
+    price, prev = np.array([[s['current'], s['prev']] for s in snaps], dtype=np.float64).reshape(-1, 2).T
+    target = np.asarray(targets, dtype=np.float64)
+    return np.column_stack([price - prev, (price - prev) / prev * 100, price - target, (price - target) / target * 100]).tolist()
+
+# 判定の style に対応する表示関数
+STYLE_FN = {"success": st.success, "error": st.error, "info": st.info}
+
+# 日中足で直近の値動きがほとんどない銘柄は、Prophetでも横ばいの予測にしかならない。
+# 直近50本の1本ごとの変化率の標準偏差がこれ未満なら、学習せずに最新値をそのまま延ばす
+FLAT_RETURN_STD = 0.0005
+
+# 学習期間の時刻に予測期間の時刻を続けたもの (Prophet の make_future_dataframe と同じ並び)
+def forecast_ds(df_p, pred_len, pred_freq):
+    future = pd.date_range(df_p['ds'].iat[-1], periods=pred_len + 1, freq=pred_freq)[1:]
+    return np.concatenate([df_p['ds'].to_numpy(), future.to_numpy()])
+
+def persistence_forecast(df_p, pred_len, pred_freq):
+    ds = forecast_ds(df_p, pred_len, pred_freq)
+    return pd.DataFrame({'ds': ds, 'yhat': np.full(len(ds), float(df_p['y'].iat[-1]))})
+
+# 軽量予測: 直線のトレンドに季節成分(sin/cos)を足した式を最小二乗で当てはめる (indicators.trend_season_fit)。
+# Prophetの学習よりずっと速い。季節成分の周期(日)は make_prophet に合わせ、日足は週、日中足は1日 (とその半分の周期) だけにする
+QUICK_PERIODS = {"1d": np.array([7.0]), "30m": np.array([1.0, 0.5]), "5m": np.array([1.0, 0.5])}
+
+def quick_forecast(df_p, interval, pred_len, pred_freq):
+    ds = forecast_ds(df_p, pred_len, pred_freq)
+    t = (ds - ds[0]) / np.timedelta64(1, 'D')
+    return pd.DataFrame({'ds': ds, 'yhat': trend_season_fit(t, df_p['y'].to_numpy(dtype=np.float64), QUICK_PERIODS[interval])})
+
+# 1銘柄分のAI予測 (ワーカースレッドで実行するので st.* の描画はしない)
+# データ取得は別タスクなので、その結果を待ってから学習する
+def forecast_ticker(ticker, data_future, interval, pred_len, pred_freq, accurate):
+    df, _ = data_future.result()
+    if df is None: return None
+    # 短期予測に全期間は要らないので、直近 FORECAST_HISTORY 本だけで学習する (学習時間は本数にほぼ比例)
+    # インデックスは get_all_stock_data でタイムゾーンなしに揃え済み。そのまま配列で渡す
+    df = df.iloc[-FORECAST_HISTORY[interval]:]
+    df_p = pd.DataFrame({'ds': df.index.to_numpy(), 'y': df['Close'].to_numpy()})
+    y = df_p['y'].to_numpy()[-51:]
+    if interval != "1d" and len(y) > 50 and np.std(np.diff(y) / y[:-1]) < FLAT_RETURN_STD:
+        return persistence_forecast(df_p, pred_len, pred_freq)
+    if not accurate: return quick_forecast(df_p, interval, pred_len, pred_freq)
+    # ウォームアップはデータ取得(通信)の間に先に投げてあるので、ここでは終わるのを待つだけ
+    warm_up_prophet()
+    # 行ごとのハッシュの合計だと並び替えに気づけないので、終値の生バイト列をそのままキーにする
+    y_bytes = df_p['y'].to_numpy().tobytes()
+    return forecast_close(ticker, interval, df.index[-1].value, y_bytes, df_p, pred_len, pred_freq)
 
 # --- メイン処理 ---
+# 銘柄は互いに独立なので、通信とAI予測を全銘柄まとめて並列に走らせる。
+# 描画はメインスレッドで銘柄順に行い、時間のかかるAI予測だけは各銘柄の描画時に待つ
+ctx = get_script_run_ctx()
+executor = ThreadPoolExecutor(max_workers=2 * len(TICKERS_CONFIG), initializer=add_script_run_ctx, initargs=(None, ctx))
+if accurate_mode: executor.submit(warm_up_prophet)
+data_futures = {ticker: executor.submit(get_stock_data, ticker, v["interval"]) for ticker in TICKERS_CONFIG}
+forecast_futures = {ticker: executor.submit(forecast_ticker, ticker, data_futures[ticker], v["interval"], PRED_LEN_MAX[v["interval"]], v["pred_freq"], accurate_mode)
+                    for ticker in TICKERS_CONFIG}
+executor.shutdown(wait=False)
+
+stock_data, fetch_errors = {}, {}
+with st.spinner('株価データを取得中...'):
+    for ticker, future in data_futures.items():
+        try:
+            df, snap = future.result()
+        except Exception as e:
+            fetch_errors[ticker] = e
+            continue
+        if df is not None and not df.empty: stock_data[ticker] = (df, snap)
+advice = dict(zip(stock_data, get_advice([snap for _, snap in stock_data.values()])))
+changes = dict(zip(stock_data, get_changes([snap for _, snap in stock_data.values()], [TICKERS_CONFIG[t]['target'] for t in stock_data])))
+
+board = []
 for ticker, info in TICKERS_CONFIG.items():
-    target_price, target_type, name = info['target'], info['type'], info['name']
-    
-    with st.spinner(f'{name} のデータを解析中...'):
-        df, prev_close = get_stock_data(ticker, v["interval"])
+    target_price, target_type, name = info['target'], info['type'], ticker_name(ticker, info)
     
-    if df is None or df.empty: continue
+    if ticker in fetch_errors:
+        st.error(f"データ取得エラー ({ticker}): {fetch_errors[ticker]}")
+        continue
+    if ticker not in stock_data: continue
+    df, snap = stock_data[ticker]
 
     with st.expander(f"📌 {name} ({ticker})", expanded=True):
         try:
-            # --- 以下、描画ロジック (変更なし) ---
             last_dt = df.index[-1]
+            idx = df.index.to_numpy()
             if selected_label == "1日":
                 day_start = last_dt.replace(hour=9, minute=0, second=0)
                 day_end = last_dt.replace(hour=15, minute=30, second=0)
-                hist_display = df.loc[day_start:day_end]
+                # 時刻の numpy 配列に直接二分探索する (ラベル検索の検証処理を通さない)
+                view = slice(idx.searchsorted(np.datetime64(day_start), side='left'), idx.searchsorted(np.datetime64(day_end), side='right'))
             else:
-                hist_display = df.tail(v["days"] if v["interval"] == "1d" else 100)
+                view = slice(max(0, len(df) - (v["days"] if v["interval"] == "1d" else 100)), len(df))
+            if view.stop <= view.start: view = slice(max(0, len(df) - 50), len(df))
             
-            if hist_display.empty: hist_display = df.tail(50)
-            current_price = float(hist_display['Close'].iloc[-1])
+            # 表示範囲は位置のスライスで持ち、各列の numpy 配列をコピーせずビューで切り出す
+            hist_x = idx[view]
+            hist_cols = {c: df[c].to_numpy()[view] for c in ('Close', 'Upper', 'Lower', 'RSI')}
             
-            # テクニカル計算
-            close_full = df['Close']
-            delta = close_full.diff()
-            gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-            rsi_series = 100 - (100 / (1 + (gain / loss)))
-            ma20 = close_full.rolling(20).mean()
-            std20 = close_full.rolling(20).std()
-            upper_s, lower_s = ma20 + (std20 * 2), ma20 - (std20 * 2)
-
-            current_rsi = rsi_series.iloc[-1]
-            status, advice_msg, style = get_advice(current_price, current_rsi, upper_s.iloc[-1], lower_s.iloc[-1])
-            if style == "success": st.success(f"**判定: {status}** \n{advice_msg}")
-            elif style == "error": st.error(f"**判定: {status}** \n{advice_msg}")
-            else: st.info(f"**判定: {status}** \n{advice_msg}")
+            # 最新値とテクニカル指標 (get_stock_data で計算済み)
+            current_price, current_rsi = snap['current'], snap['rsi']
+
+            status, advice_msg, style = advice[ticker]
+            STYLE_FN[style](f"**判定: {status}** \n{advice_msg}")
 
             # メトリクス
-            is_achieved = (current_price <= target_price) if target_type == '購入' else (current_price >= target_price)
-            metric_color = "#FF4B4B" if is_achieved else "#1F77B4"
-            rsi_color = "#FF4B4B" if current_rsi >= 70 else ("#1F77B4" if current_rsi <= 30 else "#333333")
-            p_diff, p_pct = current_price - prev_close, ((current_price - prev_close) / prev_close) * 100
-            t_diff, t_pct = current_price - target_price, ((current_price - target_price) / target_price) * 100
+            p_diff, p_pct, t_diff, t_pct = changes[ticker]
 
             c1, c2, c3 = st.columns([1.2, 1, 0.8])
-            with c1: st.markdown(f'<div style="line-height:1.2;"><p style="font-size:0.8rem; color:gray; margin:0;">現在値 (前日比)</p><p style="font-size:1.6rem; font-weight:bold; margin:0;">¥{current_price:,.1f}</p><p style="font-size:0.9rem; color:{metric_color}; font-weight:bold; margin:0;">{p_diff:+,.1f} ({p_pct:+.2f}%)</p></div>', unsafe_allow_html=True)
-            with c2: st.markdown(f'<div style="line-height:1.2;"><p style="font-size:0.8rem; color:gray; margin:0;">{target_type}目標</p><p style="font-size:1.2rem; font-weight:bold; margin:0;">¥{target_price:,.0f}</p><p style="font-size:0.9rem; color:{metric_color}; font-weight:bold; margin:0;">{t_diff:+,.1f} ({t_pct:+.2f}%)</p></div>', unsafe_allow_html=True)
-            with c3: st.markdown(f'<div style="line-height:1.2;"><p style="font-size:0.8rem; color:gray; margin:0;">RSI</p><p style="font-size:1.6rem; font-weight:bold; color:{rsi_color}; margin:0;">{current_rsi:.1f}</p></div>', unsafe_allow_html=True)
-
-            # AI予測
-            df_p = df['Close'].reset_index()
-            df_p.columns = ['ds', 'y']
-            model = Prophet(daily_seasonality=True, weekly_seasonality=True).fit(df_p)
-            forecast = model.predict(model.make_future_dataframe(periods=v["pred_len"], freq=v["pred_freq"]))
-
-            # グラフ作成
-            fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.1, row_heights=[0.7, 0.3])
-            fig.add_trace(go.Scatter(x=hist_display.index, y=upper_s.loc[hist_display.index], name='BB上', line=dict(width=0), showlegend=False), row=1, col=1)
-            fig.add_trace(go.Scatter(x=hist_display.index, y=lower_s.loc[hist_display.index], name='BB下', line=dict(width=0), fill='tonexty', fillcolor='rgba(0,150,255,0.1)', showlegend=False), row=1, col=1)
-            fig.add_trace(go.Scatter(x=hist_display.index, y=hist_display['Close'], name='実績', line=dict(color='#0055FF', width=3)), row=1, col=1)
-            fig.add_hline(y=target_price, line_dash="dash", line_color=("#28a745" if target_type == '購入' else "#dc3545"), row=1, col=1)
-            
-            fore_plot = forecast[forecast['ds'] >= hist_display.index[-1]].head(v["pred_len"] + 1)
-            if selected_label == "1日": fore_plot = fore_plot[fore_plot['ds'] <= day_end]
-            if not fore_plot.empty:
-                pred_c = "#FF0000" if fore_plot['yhat'].iloc[-1] >= current_price else "#0000FF"
-                fig.add_trace(go.Scatter(x=fore_plot['ds'], y=fore_plot['yhat'], name='予測', line=dict(color=pred_c, dash='dot', width=3)), row=1, col=1)
+            # st.metric は差分の符号で色が付く。購入目標は目標より下が達成なので色を反転して、達成側が常に緑になるようにする
+            c1.metric("現在値 (前日比)", f"¥{current_price:,.1f}", f"{p_diff:+,.1f} ({p_pct:+.2f}%)")
+            c2.metric(f"{target_type}目標", f"¥{target_price:,.0f}", f"{t_diff:+,.1f} ({t_pct:+.2f}%)", delta_color=("inverse" if target_type == '購入' else "normal"))
+            c3.metric("RSI", f"{current_rsi:.1f}")
+
+            # AI予測 (並列で計算中。終わっていなければここで待つ)
+            with st.spinner(f'{name} のデータを解析中...'):
+                forecast = forecast_futures[ticker].result()
 
-            fig.add_trace(go.Scatter(x=hist_display.index, y=rsi_series.loc[hist_display.index], name='RSI', line=dict(color='#8A2BE2', width=2)), row=2, col=1)
-            fig.update_layout(height=450, margin=dict(l=0,r=0,b=0,t=10), showlegend=False, hovermode="x unified")
-            st.plotly_chart(fig, use_container_width=True)
-            st.write(f"🔮 **AI予測 ({v['label']}):** 約 ¥{fore_plot['yhat'].iloc[-1]:,.1f}")
+            # forecast['ds'] は昇順なので、表示開始位置は二分探索で求めて位置で切り出す
+            start = forecast['ds'].searchsorted(hist_x[-1], side='left')
+            fore_plot = forecast.iloc[start:start + v["pred_len"] + 1]
+            if selected_label == "1日": fore_plot = fore_plot.iloc[:fore_plot['ds'].searchsorted(day_end, side='right')]
+
+            # グラフ作成 (まとめて表示する場合は最後に1枚の図で描く)
+            chart = (hist_x, hist_cols['Close'], hist_cols['Upper'], hist_cols['Lower'], hist_cols['RSI'],
+                     fore_plot, target_price, target_type, current_price)
+            if show_board: board.append((name, chart))
+            else: st.plotly_chart(build_figure(*chart, uirevision=selected_label), use_container_width=True)
+            st.write(f"🔮 **AI予測 ({v['label']}):** 約 ¥{fore_plot['yhat'].iat[-1]:,.1f}")
 
         except Exception as e:
             st.error(f"分析エラー: {e}")
 
-
+if board:
+    st.subheader("📈 全銘柄チャート")
+    st.plotly_chart(build_board_figure(board, uirevision=selected_label), use_container_width=True)
@@ -0,0 +1,43 @@
+import hashlib
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# --- ディスクキャッシュ ---
+# st.cache_data はプロセス内メモリなので、再起動・再デプロイのたびに全銘柄を取り直すことになる。
+# DataFrame をParquetで保存しておき、更新時刻(mtime)から経過時間を見て使うかどうかを呼び出し側で決める。
+# 置き場所は環境変数 STOCK_APP_CACHE_DIR で変えられる (永続ボリュームがある環境ではそちらを指す)
+CACHE_DIR = Path(os.environ.get("STOCK_APP_CACHE_DIR") or Path.home() / ".cache" / "my-stock-app")
+
+
+class FileCache:
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+
+    def _path(self, key):
+        # 銘柄コードの "." などを気にしなくて済むようにキーはMD5でファイル名にする
+        return self.cache_dir / f"{hashlib.md5(key.encode()).hexdigest()}.parquet"
+
+    # (DataFrame, 経過秒数) を返す。ない・読めない場合は (None, None)
+    # df.attrs も一緒に保存・復元される (pandas 2.1以降)。呼び出し側は取得時刻や元データの照合に使う
+    def get(self, key):
+        path = self._path(key)
+        try:
+            age = time.time() - path.stat().st_mtime
+            return pd.read_parquet(path), age
+        except Exception:
+            return None, None
+
+    def set(self, key, df):
+        # 書きかけのファイルを読まれないよう、一時ファイルに書いてから置き換える。
+        # キャッシュは補助なので、書けない環境(読み取り専用など)では何もしない
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            df.to_parquet(tmp, compression="zstd")
+            os.replace(tmp, path)
+        except Exception:
+            tmp.unlink(missing_ok=True)
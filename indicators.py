@@ -0,0 +1,106 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    # numbaがない環境ではそのままPythonで実行する
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]): return args[0]
+        return lambda f: f
+
+
+# テクニカル指標 (RSI, 移動平均, 標準偏差, BB上下) を1パスで計算
+# RSIは漸化式、MA/STDは窓に入る値を足し出る値を引くだけなのでO(N)。分散はWelford法で更新。
+# コンパイル結果は __pycache__ に保存されるので、JITのコストはプロセス起動後の初回だけ
+# 銘柄ごとにワーカースレッドから呼ばれるので、GILを外して複数コアで同時に走れるようにする
+@njit(cache=True, fastmath=True, nogil=True)
+def compute_indicators(close, rsi_win=14, bb_win=20):
+    n = close.shape[0]
+    rsi = np.full(n, np.nan)
+    ma = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    avg_gain = avg_loss = 0.0
+    mean = m2 = 0.0
+    for i in range(n):
+        # RSI (Wilder): 最初の rsi_win 本の単純平均で初期化し、以降は (前回×(rsi_win-1) + 今回) / rsi_win
+        if i > 0:
+            d = close[i] - close[i - 1]
+            if i <= rsi_win:
+                avg_gain += max(d, 0.0) / rsi_win
+                avg_loss += max(-d, 0.0) / rsi_win
+            else:
+                avg_gain = (avg_gain * (rsi_win - 1) + max(d, 0.0)) / rsi_win
+                avg_loss = (avg_loss * (rsi_win - 1) + max(-d, 0.0)) / rsi_win
+        if i >= rsi_win:
+            if avg_loss > 0: rsi[i] = 100 - 100 / (1 + avg_gain / avg_loss)
+            elif avg_gain > 0: rsi[i] = 100.0
+
+        # 移動平均 / 標準偏差 (不偏)
+        x = close[i]
+        if i < bb_win:
+            dx = x - mean
+            mean += dx / (i + 1)
+            m2 += dx * (x - mean)
+        else:
+            y = close[i - bb_win]
+            new_mean = mean + (x - y) / bb_win
+            m2 += (x - y) * (x - new_mean + y - mean)
+            mean = new_mean
+        if i >= bb_win - 1:
+            ma[i] = mean
+            std[i] = np.sqrt(max(m2, 0.0) / (bb_win - 1))
+    return rsi, ma, std, ma + std * 2, ma - std * 2
+
+
+# 軽量予測の本体: 直線のトレンドと周期 periods(日) の sin/cos を最小二乗で当てはめ、t の全時刻の当てはめ値を返す
+# t は先頭からの経過日数で、先頭の len(y) 個が学習期間、残りが予測期間。
+# 説明変数は高々6個なので、LAPACK(scipy)を使わず正規方程式を部分ピボット付きのガウス消去で解く
+@njit(cache=True, nogil=True)
+def trend_season_fit(t, y, periods):
+    n, m, k = y.shape[0], t.shape[0], 2 + 2 * periods.shape[0]
+    # 説明変数 [1, t, sin, cos, ...]。t は学習期間の長さで割って他の列と大きさを揃え、解を安定させる
+    scale = max(t[n - 1], 1e-9)
+    X = np.empty((m, k))
+    for i in range(m):
+        X[i, 0] = 1.0
+        X[i, 1] = t[i] / scale
+        for j in range(periods.shape[0]):
+            w = 2 * np.pi * t[i] / periods[j]
+            X[i, 2 + 2 * j] = np.sin(w)
+            X[i, 3 + 2 * j] = np.cos(w)
+
+    # 拡大係数行列 [X'X | X'y]
+    A = np.zeros((k, k + 1))
+    for i in range(n):
+        for a in range(k):
+            for b in range(k): A[a, b] += X[i, a] * X[i, b]
+            A[a, k] += X[i, a] * y[i]
+    # 前進消去。ほぼ0のピボット(他の列と重なる説明変数)はその係数を0として飛ばす
+    eps = 1e-9 * n
+    for c in range(k):
+        p = c + np.argmax(np.abs(A[c:, c]))
+        for b in range(k + 1): A[c, b], A[p, b] = A[p, b], A[c, b]
+        if abs(A[c, c]) < eps: continue
+        for r in range(c + 1, k):
+            f = A[r, c] / A[c, c]
+            for b in range(c, k + 1): A[r, b] -= f * A[c, b]
+    # 後退代入
+    beta = np.zeros(k)
+    for c in range(k - 1, -1, -1):
+        if abs(A[c, c]) < eps: continue
+        acc = A[c, k]
+        for b in range(c + 1, k): acc -= A[c, b] * beta[b]
+        beta[c] = acc / A[c, c]
+
+    out = np.empty(m)
+    for i in range(m):
+        acc = 0.0
+        for a in range(k): acc += X[i, a] * beta[a]
+        out[i] = acc
+    return out
+
+
+# 最初のユーザーにJITコンパイル待ちをさせないよう、import 時 (プロセスごとに1回) に小さな配列で一度呼んでおく
+# 引数を省略すると別のシグネチャとしてコンパイルされるので、app.py と同じ呼び方 (窓幅も渡す) にする
+compute_indicators(np.ones(32, dtype=np.float64), 14, 20)
+trend_season_fit(np.arange(8, dtype=np.float64), np.ones(6), np.array([7.0]))
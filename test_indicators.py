@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from indicators import compute_indicators, trend_season_fit
+
+
+# Wilder の RSI を素直に書いたもの (最初の14本の変化の単純平均で初期化し、以降は指数平滑)
+def wilder_rsi(close, win=14):
+    d = np.diff(close)
+    gain, loss = np.maximum(d, 0), np.maximum(-d, 0)
+    rsi = np.full(len(close), np.nan)
+    avg_gain, avg_loss = gain[:win].mean(), loss[:win].mean()
+    for i in range(win, len(close)):
+        if i > win:
+            avg_gain = (avg_gain * (win - 1) + gain[i - 1]) / win
+            avg_loss = (avg_loss * (win - 1) + loss[i - 1]) / win
+        if avg_loss > 0: rsi[i] = 100 - 100 / (1 + avg_gain / avg_loss)
+        elif avg_gain > 0: rsi[i] = 100.0
+    return rsi
+
+
+# trend_season_fit と同じ説明変数を numpy で作って lstsq で解いたもの
+def lstsq_fit(t, y, periods):
+    n = len(y)
+    cols = [np.ones_like(t), t / t[n - 1]]
+    for p in periods: cols += [np.sin(2 * np.pi * t / p), np.cos(2 * np.pi * t / p)]
+    X = np.column_stack(cols)
+    beta = np.linalg.lstsq(X[:n], y, rcond=None)[0]
+    return X @ beta
+
+
+def random_walk(n, seed=0):
+    return 1000 + np.cumsum(np.random.default_rng(seed).normal(0, 5, n))
+
+
+def test_indicators_match_pandas_rolling_and_wilder_rsi():
+    close = random_walk(500)
+    rsi, ma, std, upper, lower = compute_indicators(close, 14, 20)
+    s = pd.Series(close)
+    np.testing.assert_allclose(ma, s.rolling(20).mean(), rtol=1e-10, equal_nan=True)
+    np.testing.assert_allclose(std, s.rolling(20).std(), rtol=1e-8, equal_nan=True)
+    np.testing.assert_allclose(upper, ma + 2 * std, equal_nan=True)
+    np.testing.assert_allclose(lower, ma - 2 * std, equal_nan=True)
+    np.testing.assert_allclose(rsi, wilder_rsi(close), rtol=1e-10, equal_nan=True)
+
+
+def test_indicators_flat_and_short_series():
+    # 値動きがなければ RSI は未定義 (NaN)、標準偏差は0
+    rsi, ma, std, _, _ = compute_indicators(np.full(60, 1234.5), 14, 20)
+    assert np.isnan(rsi).all()
+    np.testing.assert_array_equal(ma[19:], 1234.5)
+    np.testing.assert_array_equal(std[19:], 0.0)
+    # 窓より短い系列はすべて NaN
+    for out in compute_indicators(np.array([1000.0]), 14, 20):
+        assert out.shape == (1,) and np.isnan(out).all()
+
+
+def test_trend_season_fit_matches_lstsq_daily():
+    # 日足: 営業日だけの180本 + 14日先まで、週の周期
+    ds = pd.bdate_range("2026-01-05", periods=194).to_numpy()
+    t = (ds - ds[0]) / np.timedelta64(1, 'D')
+    y, periods = random_walk(180), np.array([7.0])
+    np.testing.assert_allclose(trend_season_fit(t, y, periods), lstsq_fit(t, y, periods), rtol=1e-9)
+
+
+def test_trend_season_fit_matches_lstsq_intraday():
+    # 5分足: 前場・後場だけの4営業日分 + 24本先まで、1日とその半分の周期
+    days = pd.bdate_range("2026-10-08", periods=5)
+    ds = np.concatenate([pd.date_range(d + pd.Timedelta(hours=h, minutes=mi), periods=n, freq="5min").to_numpy()
+                         for d in days for h, mi, n in ((9, 0, 30), (12, 30, 36))])[:288]
+    t = (ds - ds[0]) / np.timedelta64(1, 'D')
+    y, periods = random_walk(264, seed=1), np.array([1.0, 0.5])
+    np.testing.assert_allclose(trend_season_fit(t, y, periods), lstsq_fit(t, y, periods), rtol=1e-9)
+
+
+def test_trend_season_fit_degenerate_inputs():
+    t, periods = np.arange(30, dtype=np.float64), np.array([7.0])
+    # 一定の系列はそのまま横ばい
+    np.testing.assert_allclose(trend_season_fit(t, np.full(20, 500.0), periods), 500.0, rtol=1e-12)
+    # 1本だけなら切片しか決まらないので、その値で横ばい
+    np.testing.assert_allclose(trend_season_fit(t[:5], np.array([500.0]), periods), 500.0, rtol=1e-12)